@@ -2,13 +2,15 @@
 
 import argparse
 
-def parse_args(description=None, positional_args=None, optional_args=None):
+def parse_args(description=None, positional_args=None, optional_args=None, required_one_of=None):
     """
     General purpose CLI argument parser
     Inputs:
         description (str): Description of the script's purpose
-        positional_args (list of tuples): List of positional arguments (name, help_text).
+        positional_args (list of tuples): List of positional arguments (name, help_text) or (name, help_text, kwargs),
+            kwargs being passed to "add_arguments(**kwargs)", e.g. {"nargs": "?"}.
         optional_args (list of dicts): Each dict defines optional arguments argument, passed to "add_arguments(**kwargs)".
+        required_one_of (list of str): Destinations of arguments of which at least one must be given.
     Returns:
         argparse.Namespace: Parsed arguments.
     """
@@ -17,8 +19,8 @@ def parse_args(description=None, positional_args=None, optional_args=None):
 
     # positional arguments
     if positional_args:
-        for name, help_text in positional_args:
-            parser.add_argument(name, help=help_text)
+        for name, help_text, *kwargs in positional_args:
+            parser.add_argument(name, help=help_text, **(kwargs[0] if kwargs else {}))
 
     # optional arguments
     if optional_args:
@@ -26,4 +28,10 @@ def parse_args(description=None, positional_args=None, optional_args=None):
             for flag, kwargs in opt.items():
                 parser.add_argument(flag, **kwargs)
 
-    return parser.parse_args()
+    args = parser.parse_args()
+
+    # arguments that are individually optional but cannot all be missing
+    if required_one_of and all(getattr(args, dest) is None for dest in required_one_of):
+        parser.error("one of the arguments " + ", ".join(required_one_of) + " is required")
+
+    return args
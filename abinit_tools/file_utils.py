@@ -0,0 +1,54 @@
+# abinit_tools/file_utils.py
+
+import os
+import re
+
+from functools import lru_cache
+
+_DIGITS = re.compile(r'(\d+)')
+
+# ABINIT names its outputs <prefix>o_DS<N>_GSR.nc or <prefix>o_<N>_GSR.nc
+_GSR_INDEX = re.compile(r'^(.*?)(\d+)_GSR\.nc$')
+
+def _natural_key(name):
+    """
+    Sort key comparing the numbers embedded in a file name numerically, e.g. DS2 before DS10.
+    Inputs:
+        name (str): file name
+    Returns:
+        list: alternating text and integer chunks of the name.
+    """
+    return [int(chunk) if i % 2 else chunk for i, chunk in enumerate(_DIGITS.split(name))]
+
+def _gsr_key(name):
+    """
+    Sort key ordering GSR files naturally, the trailing dataset index is extracted directly.
+    Inputs:
+        name (str): file name
+    Returns:
+        list: natural key of the prefix followed by the dataset index, or the natural key of the
+        whole name if it has no trailing index.
+    """
+    m = _GSR_INDEX.match(name)
+    if m is None:
+        return _natural_key(name)
+    # the natural key of the prefix always ends with a text chunk, so the index keeps the alternation
+    return _natural_key(m.group(1)) + [int(m.group(2))]
+
+@lru_cache(maxsize=8)
+def _list_gsr(cwd, mtime_ns):
+    """
+    Scans cwd for *GSR.nc files. Cached on (cwd, mtime_ns), adding or removing a file changes the
+    directory mtime and therefore triggers a new scan.
+    """
+    with os.scandir(cwd) as entries:
+        names = [e.name for e in entries if e.name.endswith('GSR.nc') and not e.name.startswith('.')]
+    return tuple(sorted(names, key=_gsr_key))
+
+def list_gsr_files():
+    """
+    Lists the *GSR.nc files of the current directory ordered by dataset index.
+    Returns:
+        list of str: file names.
+    """
+    return list(_list_gsr(os.getcwd(), os.stat('.').st_mtime_ns))
@@ -1,5 +1,11 @@
 import numpy as np
 
+# numexpr evaluates the peak shapes in a single pass without temporaries, numpy is used if it is missing
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
 # common fit functions
 def lorentzian(x, a, b, c):
     """
@@ -12,6 +18,9 @@ def lorentzian(x, a, b, c):
     Outputs:
         Lorentzian function evaluated at x.
     """
+    if numexpr is not None:
+        return numexpr.evaluate("(a/pi)*((c/2)/((x-b)**2+(c/2)**2))",
+                                local_dict={"x": x, "a": a, "b": b, "c": c, "pi": np.pi})
     return (a/np.pi)*((c/2)/((x-b)**2+(c/2)**2))
 
 def gaussian(x, mu, sigma):
@@ -24,6 +33,9 @@ def gaussian(x, mu, sigma):
     Returns
         Gaussian fucntion evaluated at x.
     """
+    if numexpr is not None:
+        return numexpr.evaluate("exp(-(x-mu)**2/(2*sigma**2))/sqrt(2*pi*sigma**2)",
+                                local_dict={"x": x, "mu": mu, "sigma": sigma, "pi": np.pi})
     return np.exp(-(x-mu)**2/(2*sigma**2))/np.sqrt(2*np.pi*sigma**2)
 
 # equation of states
@@ -39,7 +51,9 @@ def murnaghan(V, V_0, E_0, B_0, B_1):
     Output:
         total energy E(V)
     """
-    return E_0 + B_0*V_0*((1 / (B_1*(B_1 - 1)))*(V/V_0)**(1-B_1) + V / (B_1*V_0) - 1 /(B_1 -1) )
+    r = V/V_0
+    r_pow = r**(1.0 - B_1)
+    return E_0 + B_0*V_0*(r_pow/(B_1*(B_1 - 1)) + r/B_1 - 1/(B_1 - 1))
 
 def birch_murnaghan(V, V_0, E_0, B_0, B_1):
     """
@@ -54,4 +68,49 @@ def birch_murnaghan(V, V_0, E_0, B_0, B_1):
     Outputs:
         total energy E(V).
     """
-    return E_0 + (9*V_0*B_0/16)*(((V_0/V)**(2/4)-1)**3*B_1+((V_0/V)**(2/3)-1)**2*(6-4*(V_0/V)**(2/3)))
+    eta = np.cbrt(V_0/V) # (V_0/V)**(1/3)
+    eta2 = eta*eta       # (V_0/V)**(2/3)
+    t = eta2 - 1.0
+    return E_0 + (9.0*V_0*B_0/16.0)*(t*t*t*B_1 + t*t*(6.0 - 4.0*eta2))
+
+# analytical jacobians of the equations of state, used to avoid finite differences in curve_fit
+def murnaghan_jac(V, V_0, E_0, B_0, B_1):
+    """
+    Jacobian of the Murnaghan equation of state with respect to its parameters.
+    Inputs:
+        same as murnaghan
+    Outputs:
+        Nx4 array of partial derivatives with respect to V_0, E_0, B_0, B_1.
+    """
+    V = np.asarray(V, dtype=float)
+    r = V/V_0
+    r_pow = r**(1.0 - B_1)
+    c = 1/(B_1*(B_1 - 1))
+
+    dV_0 = B_0*(r_pow - 1)/(B_1 - 1)
+    dE_0 = np.ones_like(V)
+    dB_0 = V_0*(c*r_pow + r/B_1 - 1/(B_1 - 1))
+    dB_1 = B_0*V_0*(-c*r_pow*(np.log(r) + (2*B_1 - 1)*c) - r/B_1**2 + 1/(B_1 - 1)**2)
+    return np.column_stack((dV_0, dE_0, dB_0, dB_1))
+
+def birch_murnaghan_jac(V, V_0, E_0, B_0, B_1):
+    """
+    Jacobian of the Birch-Murnaghan equation of state with respect to its parameters.
+    Inputs:
+        same as birch_murnaghan
+    Outputs:
+        Nx4 array of partial derivatives with respect to V_0, E_0, B_0, B_1.
+    """
+    V = np.asarray(V, dtype=float)
+    eta = np.cbrt(V_0/V)
+    eta2 = eta*eta
+    t = eta2 - 1.0
+    t2 = t*t
+    # bracket of birch_murnaghan, using 6 - 4*eta2 = 2 - 4*t
+    S = (B_1 - 4.0)*t2*t + 2.0*t2
+
+    dV_0 = (9.0*B_0/16.0)*(S + (2.0/3.0)*eta2*(3.0*(B_1 - 4.0)*t2 + 4.0*t))
+    dE_0 = np.ones_like(V)
+    dB_0 = (9.0*V_0/16.0)*S
+    dB_1 = (9.0*V_0*B_0/16.0)*t2*t
+    return np.column_stack((dV_0, dE_0, dB_0, dB_1))
@@ -1,21 +1,49 @@
-def setup(use_pgf=True):
-
-    import matplotlib
+import matplotlib
+
+# pyplot, imported once on the first call to setup
+_PLT = None
+
+# rcParams changed by setup, and their values before its first call
+_MANAGED_KEYS = ("pgf.texsystem", 'font.family', 'pgf.rcfonts', 'text.usetex')
+_USER_RC = None
+
+def setup(use_pgf=False, use_tex=False, headless=False):
+    """
+    Configures matplotlib and returns pyplot.
+    Inputs:
+        use_pgf: use the pgf backend to save plots as .pgf files
+        use_tex: render text with LaTeX, otherwise the text.usetex setting of the user's matplotlibrc is kept
+        headless: use the non-interactive Agg backend, for plots that are only saved
+    Outputs:
+        matplotlib.pyplot
+    """
+    global _PLT, _USER_RC
 
     if use_pgf:
         matplotlib.use('pgf')
+    elif headless:
+        matplotlib.use('Agg')
+
+    if _PLT is None:
+        import matplotlib.pyplot as plt
+        _PLT = plt
 
-    import matplotlib.pyplot as plt
+    # pyplot is shared between calls, so the settings changed here are restored to the user's own
+    # (matplotlibrc or style) when they are not requested
+    if _USER_RC is None:
+        _USER_RC = {key: _PLT.rcParams[key] for key in _MANAGED_KEYS}
+    _PLT.rcParams.update(_USER_RC)
 
     if use_pgf:
-        plt.rcParams.update({
+        _PLT.rcParams.update({
             "pgf.texsystem": "pdflatex",
             'font.family': 'serif',
-            'text.usetex': True,
             'pgf.rcfonts': True,
         })
 
-    return plt
-
-
+    if use_tex:
+        _PLT.rcParams.update({
+            'text.usetex': True,
+        })
 
+    return _PLT
@@ -6,74 +6,154 @@ Automatically converts to a primitive cell using pymatgen.
 
 Usage:
     python cif2abi.py crystal.cif
+    python cif2abi.py --batch "cif_files/*.cif"
 
 Inputs:
-    .cif file as command line argument
+    .cif file as command line argument, or a glob pattern of .cif files with --batch
 
 Outputs:
     .abi file with ABINIT-compatible structure block
 
 Dependencies:
-    pymatgen, numpy, ase
+    pymatgen, spglib, numpy, ase
 """
 import numpy as np
 import os
-
+import glob
+import hashlib
+import multiprocessing
+import pickle
+import sys
+import spglib
+
+from functools import partial
 from pymatgen.core import Structure as PMGStructure
 from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
 from abinit_tools.argparse_utils import parse_args
 from ase.units import Bohr
 
-def clean_format(x, tol=1e-14, precision=2):
+def clean_row(arr, tol=1e-14, precision=2):
     """
-    Returns clean string for float x.
+    Returns clean string for a row of floats.
     Inputs:
-        x: float to be cleaned
+        arr: array of floats to be cleaned
         tol: numbers smaller than this will be set to zero
         precision: number of decimals to keep
     Outputs:
-        cleaned float
+        cleaned floats separated by spaces
     """
-    if abs(x) < tol:
-        x = 0
-    return f"{x:.{precision}f}"
+    arr = np.asarray(arr, dtype=float)
+    arr = np.where(np.abs(arr) < tol, 0.0, arr)
+    return ' '.join(f"{x:.{precision}f}" for x in arr.tolist())
+
+# boilerplate appended to the structure block by --full
+FULL_TEMPLATE = """\
+# pseudopotentials
+pp_dirpath "$ABI_PSP"
+pseudos ""
+
+# exchange-correlation functional
+ixc 11 # PBE
+
+# planewave basis set
+ecut 20 # planewave energy cutoff
+
+# kpoint grid
+kptopt 1
+ngkpt 8 8 8
+nshiftk 4
+shiftk
+  0.5 0.5 0.5
+  0.5 0.0 0.0
+  0.0 0.5 0.0
+  0.0 0.0 0.5
+
+# SCF procedure
+nstep 50
+toldfe 1.0d-8
+diemac 12.0
+
+# postprocessing
+prtvol 1
+"""
 
-def main():
-    args = parse_args(
-        description="Converts crystallographic data in .cif file to .abi ABINIT-compatible input file.",
-        positional_args=[
-            ("cif_file", "Input cif file path.")
-        ],
-        optional_args=[
-            {"--full": {"action": "store_true", "help": "Generates full ABINIT ready .abi file, not just the crystal info."}}
-        ]
-    )
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "cif2abi")
 
-    cif_file = args.cif_file
+def load_primitive(cif_file):
+    """
+    Returns the primitive standard cell of the structure in a .cif file. The result is cached on disk
+    and reused as long as the .cif file and the spglib version are unchanged.
+    Inputs:
+        cif_file: path to the .cif file
+    Outputs:
+        lattice matrix in angstrom, fractional coordinates, atomic numbers
+    """
+    path = os.path.abspath(cif_file)
+    key = (path, os.stat(path).st_mtime_ns, spglib.__version__)
+
+    # one cache file per .cif file, overwritten when the key changes so stale entries never pile up
+    cache_path = os.path.join(CACHE_DIR, hashlib.sha1(path.encode()).hexdigest() + ".pkl")
+
+    try:
+        with open(cache_path, "rb") as f:
+            cached_key, result = pickle.load(f)
+        if cached_key == key:
+            return result
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError):
+        pass
 
     struct = PMGStructure.from_file(cif_file)
     primitive = SpacegroupAnalyzer(struct).get_primitive_standard_structure()
 
-    # get lattice vectors in angstrom
-    latt = primitive.lattice.matrix
+    # keep only what is written to the .abi file
+    result = (
+        primitive.lattice.matrix,
+        np.asarray(primitive.frac_coords),
+        np.fromiter((site.specie.Z for site in primitive), dtype=np.int16, count=len(primitive)),
+    )
+
+    # the cache is only an optimization, the conversion goes on if it cannot be written. The temporary
+    # file and os.replace make sure a concurrent run never reads a partial file.
+    tmp_path = f"{cache_path}.{os.getpid()}"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            pickle.dump((key, result), f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # e.g. disk full, do not leave the partial temporary file behind
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
+    return result
+
+def process_one_cif(cif_file, full=False):
+    """
+    Converts one .cif file to an .abi file in the abi_files/ directory next to its parent directory.
+    Inputs:
+        cif_file: path to the .cif file
+        full: also write the minimal working ABINIT input around the structure block
+    """
+    # get lattice vectors in angstrom, reduced coordinates and atomic numbers of the primitive cell
+    latt, frac_coords, atomic_number = load_primitive(cif_file)
 
     # converting to Bohr
     latt_bohr = latt / Bohr
 
     # acell: norms of lattice vectors
-    acell = [np.linalg.norm(vec) for vec in latt_bohr]
+    acell = np.linalg.norm(latt_bohr, axis=1)
 
     # rprim: normalized lattice vectors
-    rprim = [vec / np.linalg.norm(vec) for vec in latt_bohr]
-
-    # atomic numbers
-    atomic_number = [site.specie.Z for site in primitive]
+    rprim = latt_bohr / acell[:, None]
 
     # extract the different types of elements
     unique_z = sorted(set(atomic_number))
 
     # typat: type index to each atom based on its atomic number
-    typat = [unique_z.index(z) + 1 for z in atomic_number]
+    type_index = {z: i + 1 for i, z in enumerate(unique_z)}
+    typat = [type_index[z] for z in atomic_number]
 
     # extract base filename without extension
     basename = os.path.splitext(os.path.basename(cif_file))[0]
@@ -89,62 +169,57 @@ def main():
     # ensure abi_files/ exists
     os.makedirs(abi_dir, exist_ok=True)
 
+    # building the content of the .abi file
+    parts = []
+    parts.append("# Abinit crystal structure\n")
+    parts.append("acell " + clean_row(acell) + "  # in Bohr\n")
+    parts.append("rprim\n")
+    for vec in rprim:
+        parts.append("  " + clean_row(vec) + "\n")
+
+    parts.append(f"natom {len(atomic_number)}\n")
+    parts.append(f"ntypat {len(unique_z)}\n")
+    parts.append("znucl " + ' '.join(str(z) for z in unique_z) + "\n")
+    parts.append("typat " + ' '.join(str(t) for t in typat) + "\n")
+
+    parts.append("xred\n")
+    for coords in frac_coords:
+        parts.append("  " + clean_row(coords) + "\n")
+    parts.append("\n")
+
+    if full:
+        parts.append(FULL_TEMPLATE)
+
     # writing in the .abi file
     with open(abi_path, "w") as f:
+        f.write("".join(parts))
+
+    if full:
+        print('Writing minimal working example with crystal structure information in an ABINIT readable .abi file')
+    else:
+        print('Writing crystal structure file in an ABINIT readable .abi file.')
+
+def main():
+    args = parse_args(
+        description="Converts crystallographic data in .cif file to .abi ABINIT-compatible input file.",
+        positional_args=[
+            ("cif_file", "Input cif file path.", {"nargs": "?"})
+        ],
+        optional_args=[
+            {"--full": {"action": "store_true", "help": "Generates full ABINIT ready .abi file, not just the crystal info."}},
+            {"--batch": {"help": "Glob pattern of cif files to convert in parallel, e.g. 'cif_files/*.cif'."}}
+        ],
+        required_one_of=["cif_file", "batch"]
+    )
 
-        f.write("# Abinit crystal structure\n")
-        f.write("acell " + ' '.join(clean_format(a) for a in acell) + "  # in Bohr\n")
-        f.write("rprim\n")
-        for vec in rprim:
-            f.write("  " + ' '.join(clean_format(x) for x in vec) + "\n")
-
-        f.write(f"natom {len(primitive)}\n")
-        f.write(f"ntypat {len(unique_z)}\n")
-        f.write("znucl " + ' '.join(str(z) for z in unique_z) + "\n")
-        f.write("typat " + ' '.join(str(t) for t in typat) + "\n")
-
-        f.write("xred\n")
-        for site in primitive:
-            f.write("  " + ' '.join(clean_format(x) for x in site.frac_coords) + "\n")
-        f.write("\n")
-
-        if args.full:
-            f.write("# pseudopotentials\n")
-            f.write('pp_dirpath "$ABI_PSP"\n')
-            f.write('pseudos ""\n')
-            f.write('\n')
-
-            f.write('# exchange-correlation functional\n')
-            f.write('ixc 11 # PBE\n')
-            f.write('\n')
-
-            f.write('# planewave basis set\n')
-            f.write('ecut 20 # planewave energy cutoff\n')
-            f.write('\n')
-
-            f.write('# kpoint grid\n')
-            f.write('kptopt 1\n')
-            f.write('ngkpt 8 8 8\n')
-            f.write('nshiftk 4\n')
-            f.write('shiftk\n')
-            f.write('  0.5 0.5 0.5\n')
-            f.write('  0.5 0.0 0.0\n')
-            f.write('  0.0 0.5 0.0\n')
-            f.write('  0.0 0.0 0.5\n')
-            f.write('\n')
-
-            f.write('# SCF procedure\n')
-            f.write('nstep 50\n')
-            f.write('toldfe 1.0d-8\n')
-            f.write('diemac 12.0\n')
-            f.write('\n')
-
-            f.write('# postprocessing\n')
-            f.write('prtvol 1\n')
-
-            print('Writing minimal working example with crystal structure information in an ABINIT readable .abi file')
-        else:
-            print('Writing crystal structure file in an ABINIT readable .abi file.')
+    if args.batch:
+        cif_files = sorted(glob.glob(args.batch))
+        if not cif_files:
+            sys.exit(f"No cif file matches '{args.batch}'")
+        with multiprocessing.Pool() as pool:
+            pool.map(partial(process_one_cif, full=args.full), cif_files)
+    else:
+        process_one_cif(args.cif_file, full=args.full)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
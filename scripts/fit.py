@@ -8,47 +8,54 @@ Usage:
 
 Inputs:
     *GSR.nc files, --param {ecut, nkpt, volume}, --fit {murnaghan, birch-murnaghan, lorentzian, gaussian}
-     --preview {yes, no}
+     --preview {yes, no}, --tex
 
 Outputs:
     Best fit parameters, covariance matrix, plot of data + fit
 
 Dependencies:
-    abinit_tools abipy natsort numpy, matplotlib, scipy
+    abinit_tools netCDF4 numpy, matplotlib, scipy
 """
 
 import numpy as np
-import glob
-import abinit_tools.fits
 
-from natsort import natsorted
-from reader import reader
-from abinit_tools.plot_config import setup
+from abinit_tools.fits import lorentzian, murnaghan, birch_murnaghan, murnaghan_jac, birch_murnaghan_jac
 from abinit_tools.argparse_utils import parse_args
+from abinit_tools.file_utils import list_gsr_files
 from scipy.optimize import curve_fit
 
-def fit_curve(x_data, y_data, fit=abinit_tools.fits.lorentzian):
+# analytical jacobians of the fit functions that have one
+fit_jacobians = {
+    murnaghan: murnaghan_jac,
+    birch_murnaghan: birch_murnaghan_jac,
+}
+
+def fit_curve(x_data, y_data, fit=lorentzian):
     """
     Fits a curve to the data using scipy.optimize.curve_fit and returns optimal parameters.
     Inputs:
-        x_data: 1xN array
-        y_data: 1xN array
+        x_data: 1xN ndarray
+        y_data: 1xN ndarray
         fit: function: type of fit to perform. Default is lorentzian.
     Outputs: array: array of optimal parameters
     """
     # initial guess required by scipy.optimize.curve_fit
-    if fit == abinit_tools.fits.lorentzian:
-        p0 = [min(y_data), x_data[np.argmin(y_data)], 1.0]
-    elif fit in [abinit_tools.fits.murnaghan, abinit_tools.fits.birch_murnaghan]:
+    if fit == lorentzian:
+        p0 = [np.min(y_data), x_data[np.argmin(y_data)], 1.0]
+    elif fit in [murnaghan, birch_murnaghan]:
         V0_guess = x_data[np.argmin(y_data)]  # volume at minimum energy
-        E0_guess = min(y_data)
+        E0_guess = np.min(y_data)
         B0_guess = 0.5  # Ha/Bohr^3 — rough estimate
         B1_guess = 4.0
         p0 = [V0_guess, E0_guess, B0_guess, B1_guess]
     else:
         raise ValueError("Unknown fit function")
-    # fit
-    popt, pcov = curve_fit(fit, x_data, y_data, p0=p0)
+    # fit, with the analytical jacobian when one is available
+    jac = fit_jacobians.get(fit, None)
+    if jac is None:
+        popt, pcov = curve_fit(fit, x_data, y_data, p0=p0)
+    else:
+        popt, pcov = curve_fit(fit, x_data, y_data, p0=p0, jac=jac, method='lm')
     return popt, pcov
 
 def main():
@@ -76,17 +83,32 @@ def main():
                     "action": "store_true",
                     "help": "Display the plot on screen, but does not save the plot."
                 }
+            },
+            {
+                "--tex": {
+                    "action": "store_true",
+                    "help": "Render the text of the plot with LaTeX."
+                }
             }
         ]
     )
 
-    files = natsorted(glob.glob("*GSR.nc"))
+    # heavy imports (netCDF4, matplotlib) only once the arguments are valid
+    from reader import reader
+    from abinit_tools.plot_config import setup
+
+    files = list_gsr_files()
     energy, params = reader(files, args.param)
 
+    # sort the data by parameter so the plotted data follows the x axis
+    order = np.argsort(params)
+    params = params[order]
+    energy = energy[order]
+
     fit_dispatch = {
-        "lorentzian": abinit_tools.fits.lorentzian,
-        "murnaghan": abinit_tools.fits.murnaghan,
-        "birch-murnaghan": abinit_tools.fits.birch_murnaghan,
+        "lorentzian": lorentzian,
+        "murnaghan": murnaghan,
+        "birch-murnaghan": birch_murnaghan,
     }
 
     if args.fit not in fit_dispatch:
@@ -99,9 +121,9 @@ def main():
     print("Covariance matrix: ", pcov)
 
     # Plot
-    plt = setup(use_pgf= not args.preview)
+    plt = setup(use_pgf= not args.preview, use_tex=args.tex)
 
-    x_fit = np.linspace(min(params), max(params), 200)
+    x_fit = np.linspace(np.min(params), np.max(params), 200)
     y_fit = fit_func(x_fit, *popt)
 
     plt.plot(params, energy, 'ok', label='Data')
@@ -8,21 +8,17 @@ Usage:
     python plot.py --param PARAM, in the directory with *GSR.nc file to analyze
 
 Inputs:
-    *GSR.nc files, --param: ecut, nkpt, volume, acell.
+    *GSR.nc files, --param: ecut, nkpt, volume, acell. --out to choose the output file, --tex to render text with LaTeX.
 
 Outputs:
-    Plot of total_energy vs param
+    Plot of total_energy vs param, saved to out.pgf unless --out is given
 
 Dependencies:
-    matplotlib, natsort, abinit_tools.reader
+    matplotlib, abinit_tools.reader
 """
 
-import glob
-
-from natsort import natsorted
-from reader import reader
-from abinit_tools.plot_config import setup
 from abinit_tools.argparse_utils import parse_args
+from abinit_tools.file_utils import list_gsr_files
 
 def main():
     args = parse_args(
@@ -41,21 +37,51 @@ def main():
                     "action": "store_true",
                     "help": "display the plot on screen, but does not save the plot."
                 }
+            },
+            {
+                "--out":{
+                    "help": "file the plot is saved to, .pgf files use the pgf backend, others the Agg backend.",
+                    "default": "out.pgf",
+                    "type": str,
+                }
+            },
+            {
+                "--verbose":{
+                    "action": "store_true",
+                    "help": "print the energies and parameters read from the files."
+                }
+            },
+            {
+                "--tex":{
+                    "action": "store_true",
+                    "help": "render the text of the plot with LaTeX."
+                }
             }
         ]
     )
 
-    files = natsorted(glob.glob("*GSR.nc"))
+    # heavy imports (netCDF4, matplotlib) only once the arguments are valid
+    from reader import reader
+    from abinit_tools.plot_config import setup
+
+    files = list_gsr_files()
     energy, params = reader(files, args.param)
 
-    print(energy)
-    print(params)
+    if args.verbose:
+        print(energy)
+        print(params)
 
     # plot
-    plt = setup(use_pgf= not args.preview)
+    use_pgf = not args.preview and args.out.endswith(".pgf")
+    plt = setup(use_pgf=use_pgf, use_tex=args.tex, headless=not args.preview)
 
-    plt.plot(params, energy, "*k")
-    plt.plot(params, energy, "--k")
+    if params.ndim == 1:
+        plt.plot(params, energy, "*--k")
+    else:
+        # acell and rprim: one curve per component
+        for j, col in enumerate(params.reshape(len(params), -1).T):
+            plt.plot(col, energy, "*--", label=f"{args.param}[{j}]")
+        plt.legend()
     plt.ylabel("Energy (Ha)")
     plt.xlabel(f"{args.param}")
     plt.tight_layout()
@@ -63,7 +89,7 @@ def main():
     if args.preview:
         plt.show()
     else:
-        plt.savefig("out.pgf")
+        plt.savefig(args.out, dpi=120)
 
 if __name__ == "__main__":
     main()
@@ -4,49 +4,298 @@ reader.py:
     ecut, volume, nkpt, acell, rprim.
 Usage:
     python reader.py, in the directory that containts the GSR.nc files to analyze.
+    mpirun -n N python reader.py, to split the files across N MPI ranks. Open MPI, MPICH/Hydra and Slurm's srun
+    (PMI or PMIx) launchers are detected, under other launchers every rank reads every file.
 Inputs:
     GSR.nc ABINIT ouput files.
 Outputs:
     energy, parameter.
 Dependencies:
-    abipy, ase, natsort
+    netCDF4, tqdm, mpi4py (optional, to split the files across MPI ranks)
 """
 
 import numpy as np
-import glob
+import os
+import sys
+import hashlib
+import pickle
+import netCDF4
 
-from natsort import natsorted
-from abipy.abilab import abiopen
-from ase.units import Bohr
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from tqdm import tqdm
 from abinit_tools.argparse_utils import parse_args
+from abinit_tools.file_utils import list_gsr_files
 
-def reader(files, param):
-    energy = []
-    params = []
+# per-file results of previous runs, one pickle per directory of GSR files
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "abinit_tools", "reader")
+
+# bumped whenever the meaning of the cached values changes, entries of other versions are ignored
+_CACHE_VERSION = 1
+
+# files up to this size are fetched whole with a single read, larger ones are opened by path so that
+# only the few variables needed are read
+_IN_MEMORY_MAX = 1 << 20
+
+def _prefetch(files):
+    """
+    Asks the kernel to start reading the small files, the ones read whole, into the page cache before
+    they are opened.
+    Inputs:
+        files: list of files to prefetch
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
 
     for f in files:
-        print("Processing {}".format(f))
-
-        with abiopen(f) as gsr:
-            # get lattice structure and convert it to bohr
-            lattice = gsr.structure.lattice.matrix
-            lattice_bohr = lattice / Bohr
-
-            energy.append(gsr.energy)
-
-            if param == 'volume':
-                params.append(float(np.linalg.det(lattice_bohr)))
-            elif param == 'ecut':
-                params.append(float(gsr.ecut.to("Ha")))
-            elif param == 'nkpt':
-                params.append(float(gsr.nkpt))
-            elif param == 'acell':
-                params.append(np.linalg.norm(lattice_bohr, axis=1).tolist())
-            elif param == 'rprim':
-                acell = np.linalg.norm(lattice_bohr, axis=1)
-                params.append((lattice_bohr/acell[:,...]).tolist())
+        fd = os.open(f, os.O_RDONLY)
+        try:
+            if os.fstat(fd).st_size <= _IN_MEMORY_MAX:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+
+def _open_gsr(f):
+    """
+    Opens a GSR.nc file for reading. Small files are fetched with a single read and decoded from
+    memory, instead of letting the netCDF/HDF5 library issue many small reads. Larger files are opened
+    by path, so that only the variables needed are read.
+    Inputs:
+        f: path to the GSR.nc file
+    Outputs:
+        netCDF4.Dataset
+    """
+    if os.path.getsize(f) <= _IN_MEMORY_MAX:
+        with open(f, 'rb') as fh:
+            buf = fh.read()
+        ds = netCDF4.Dataset(f, 'r', memory=buf)
+    else:
+        ds = netCDF4.Dataset(f, 'r')
+
+    # the variables read have no fill values, return plain arrays instead of masked arrays
+    ds.set_auto_mask(False)
+    return ds
+
+# extractors of the raw data behind each parameter from an open GSR.nc dataset, the lattice
+# parameters all read the primitive vectors (in Bohr) and are derived afterwards for the whole sweep
+def _ecut(ds):
+    return float(ds.variables['ecut'][...])
+
+def _nkpt(ds):
+    return float(ds.dimensions['number_of_kpoints'].size)
+
+def _lattice(ds):
+    return ds.variables['primitive_vectors'][:]
+
+_EXTRACTORS = {'volume': _lattice, 'ecut': _ecut, 'nkpt': _nkpt, 'acell': _lattice, 'rprim': _lattice}
+
+# shape of the raw data read for each extractor
+_RAW_SHAPES = {_ecut: (), _nkpt: (), _lattice: (3, 3)}
+
+# derivation of the lattice parameters from the Nx3x3 primitive vectors of the sweep
+def _volumes(prim):
+    return np.linalg.det(prim)
+
+def _acells(prim):
+    # row norms of every matrix, without np.linalg.norm's argument handling
+    return np.sqrt(np.einsum('nij,nij->ni', prim, prim))
+
+def _rprims(prim):
+    return prim/_acells(prim)[..., None]
+
+_DERIVE = {'volume': _volumes, 'acell': _acells, 'rprim': _rprims}
+
+def _extract_one(f, extract):
+    """
+    Extracts the total energy and the raw data behind a parameter from a single GSR.nc file.
+    Inputs:
+        f: path to the GSR.nc file
+        extract: extractor of the parameter, one of _EXTRACTORS
+    Outputs:
+        (energy, raw data)
+    """
+    with _open_gsr(f) as ds:
+        # total energy in Ha
+        return float(ds.variables['etotal'][...]), extract(ds)
+
+# environment variables holding the number of ranks, set by the Open MPI, MPICH/Hydra (PMI) and Slurm launchers
+_MPI_SIZE_VARIABLES = ("OMPI_COMM_WORLD_SIZE", "PMI_SIZE", "SLURM_STEP_NUM_TASKS")
+
+# set by PMIx based launchers (Open MPI 5, srun --mpi=pmix), which export no size variable
+_PMIX_VARIABLES = ("PMIX_RANK",)
+
+def _mpi_comm():
+    """
+    Returns MPI.COMM_WORLD when launched by an MPI launcher and mpi4py is available, None otherwise.
+    mpi4py is only imported when the launcher reports more than one rank, or is PMIx based, and once
+    it is imported the files are always read through the communicator, serially when it has a single
+    rank, so that the process pool never forks after MPI has been initialized.
+    """
+    sizes = [os.environ[v] for v in _MPI_SIZE_VARIABLES if v in os.environ]
+    launched = (any(size.isdigit() and int(size) > 1 for size in sizes)
+                or any(v in os.environ for v in _PMIX_VARIABLES))
+    if not launched:
+        return None
+    try:
+        from mpi4py import MPI
+    except ImportError:
+        return None
+    return MPI.COMM_WORLD
+
+def _read_files(files, extract, comm=None):
+    """
+    Reads the total energy and the raw data behind a parameter from every file, one file per worker process,
+    or split round-robin across the MPI ranks of comm.
+    Inputs:
+        files: list of GSR.nc files, results are returned in the same order
+        extract: extractor of the parameter, one of _EXTRACTORS
+        comm: MPI communicator, or None
+    Outputs:
+        list of (energy, raw data)
+    """
+    n = len(files)
+
+    # progress bar on stderr, only on a terminal
+    progress = partial(tqdm, unit='file', disable=not sys.stderr.isatty())
+
+    if comm is not None:
+        local = [(i, _extract_one(files[i], extract))
+                 for i in progress(range(comm.rank, n, comm.size), disable=comm.rank != 0 or not sys.stderr.isatty())]
+        results = [None]*n
+        for part in comm.allgather(local):
+            for i, result in part:
+                results[i] = result
+        return results
+
+    _prefetch(files)
+
+    # no more workers than files, and no pool at all when there is nothing to overlap
+    nproc = min(os.cpu_count() or 1, n)
+    if nproc == 1:
+        return [_extract_one(f, extract) for f in progress(files)]
+
+    with ProcessPoolExecutor(max_workers=nproc) as executor:
+        return list(progress(executor.map(partial(_extract_one, extract=extract), files,
+                                          chunksize=max(1, n//(4*nproc))), total=n))
+
+def _cache_key(f, extract):
+    """
+    Key of a file in the reader cache, changes whenever the file is rewritten. Parameters sharing an
+    extractor share the cached raw data.
+    """
+    st = os.stat(f)
+    return (_CACHE_VERSION, os.path.abspath(f), st.st_size, st.st_mtime_ns, extract.__name__)
+
+def _cache_path(directory):
+    """
+    Path of the reader cache of a directory of GSR files.
+    """
+    return os.path.join(CACHE_DIR, hashlib.sha1(directory.encode()).hexdigest() + ".pkl")
+
+def _load_cache(directories):
+    """
+    Loads the reader cache of the directories, a missing or unreadable cache is treated as empty.
+    """
+    cache = {}
+    for directory in directories:
+        try:
+            with open(_cache_path(directory), "rb") as fh:
+                entries = pickle.load(fh)
+        except Exception:
+            # corrupt, truncated or written by an incompatible version, the files are read again
+            continue
+        if isinstance(entries, dict):
+            cache.update((key, value) for key, value in entries.items()
+                         if isinstance(key, tuple) and len(key) == 5)
+    return cache
+
+def _save_cache(cache):
+    """
+    Saves the reader cache, one file per directory. Each file is written to a temporary file first so
+    that concurrent runs never see a partial file. Nothing is saved if the cache directory is not writable.
+    """
+    by_directory = {}
+    for key, value in cache.items():
+        by_directory.setdefault(os.path.dirname(key[1]), {})[key] = value
+
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        for directory, entries in by_directory.items():
+            path = _cache_path(directory)
+            tmp_path = f"{path}.{os.getpid()}"
+            try:
+                with open(tmp_path, "wb") as fh:
+                    pickle.dump(entries, fh)
+                os.replace(tmp_path, path)
+            except OSError:
+                # e.g. disk full, do not leave the partial temporary file behind
+                try:
+                    os.unlink(tmp_path)
+                except FileNotFoundError:
+                    pass
+                raise
+    except OSError:
+        pass
+
+def _prune_cache(cache, keys):
+    """
+    Drops the entries of other cache versions, of deleted files, and of files read again under a new key,
+    so that each directory's cache stays bounded by its files and extractors.
+    """
+    current = set(keys)
+    renewed = {(key[1], key[4]) for key in keys}
+    return {key: value for key, value in cache.items()
+            if key[0] == _CACHE_VERSION
+            and (key in current or ((key[1], key[4]) not in renewed and os.path.exists(key[1])))}
+
+def reader(files, param, cache=True):
+    """
+    Reads the total energy and the requested parameter from every file. Results are cached on disk
+    per file and reused until the file changes.
+    Inputs:
+        files: list of GSR.nc files, results are returned in the same order
+        param: parameter to extract
+        cache: use the on-disk cache, also disabled by setting the ABINIT_TOOLS_NO_CACHE environment variable
+    Outputs:
+        energy, params: arrays of total energies (N) and parameter values (N, Nx3 or Nx3x3)
+    """
+    try:
+        extract = _EXTRACTORS[param]
+    except KeyError:
+        raise TypeError(f"Unknown parameter '{param}'. Valid options are 'volume', 'ecut', 'nkpt', 'acell', and 'rprim'") from None
+
+    n = len(files)
+    energy = np.empty(n)
+    raw = np.empty((n,) + _RAW_SHAPES[extract])
+
+    if n > 0:
+        comm = _mpi_comm()
+
+        if not cache or os.environ.get("ABINIT_TOOLS_NO_CACHE"):
+            for i, result in enumerate(_read_files(files, extract, comm)):
+                energy[i], raw[i] = result
+        else:
+            # only files that changed since they were last read are opened, under MPI every rank uses rank 0's cache
+            keys = [_cache_key(f, extract) for f in files]
+            directories = {os.path.dirname(key[1]) for key in keys}
+            if comm is None:
+                results = _load_cache(directories)
             else:
-                raise TypeError(f"Unknown parameter '{param}'. Valid options are 'volume', 'ecut', 'nkpt', 'acell', and 'rprim'")
+                results = comm.bcast(_load_cache(directories) if comm.rank == 0 else None)
+            missing = [(f, key) for f, key in zip(files, keys) if key not in results]
+
+            if missing:
+                missing_files, missing_keys = zip(*missing)
+                results.update(zip(missing_keys, _read_files(list(missing_files), extract, comm)))
+                if comm is None or comm.rank == 0:
+                    _save_cache(_prune_cache(results, keys))
+
+            for i, key in enumerate(keys):
+                energy[i], raw[i] = results[key]
+
+    # lattice parameters are derived in one vectorized call over the whole sweep
+    derive = _DERIVE.get(param)
+    params = raw if derive is None else derive(raw)
     return energy, params
 
 def main():
@@ -64,11 +313,15 @@ def main():
         ]
     )
 
-    files = natsorted(glob.glob("*GSR.nc"))
+    files = list_gsr_files()
 
     energy, params = reader(files, args.param)
-    print('Energy ', energy)
-    print(f"Parameter '{args.param}' ", params)
+
+    # every rank holds the full results, only one prints them
+    comm = _mpi_comm()
+    if comm is None or comm.rank == 0:
+        print('Energy ', energy)
+        print(f"Parameter '{args.param}' ", params)
 
 if __name__ == "__main__":
     main()